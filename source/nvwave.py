@@ -13,6 +13,7 @@
 )
 from enum import Enum, auto
 from ctypes import (
+	c_char,
 	c_uint,
 	byref,
 	c_void_p,
@@ -314,7 +315,7 @@ def close(self):
 
 	def feed(
 		self,
-		data: typing.Union[bytes, c_void_p],
+		data: typing.Union[bytes, memoryview, c_void_p],
 		size: typing.Optional[int] = None,
 		onDone: typing.Optional[typing.Callable] = None,
 	) -> None:
@@ -324,8 +325,9 @@ def feed(
 		This allows for uninterrupted playback as long as a new chunk is fed before
 		the previous chunk has finished playing.
 		@param data: Waveform audio in the format specified when this instance was constructed.
+			A writable memoryview (e.g. of a numpy array) is passed through without being copied.
 		@param size: The size of the data in bytes if data is a ctypes pointer.
-			If data is a Python bytes object, size should be None.
+			If data is a Python bytes object or a memoryview, size should be None.
 		@param onDone: Function to call when this chunk has finished playing.
 		@raise WindowsError: If there was an error initially opening the device.
 		"""
@@ -339,7 +341,13 @@ def feed(
 		# turn off trimming temporarily.
 		if self._purpose is AudioPurpose.SPEECH and self._isLeadingSilenceInserted:
 			self.startTrimmingLeadingSilence(False)
-		if not isinstance(data, bytes):
+		if isinstance(data, memoryview):
+			if data.readonly:
+				data = data.tobytes()
+			else:
+				data = (c_char * data.nbytes).from_buffer(data)
+			size = None
+		elif not isinstance(data, bytes):
 			data = string_at(data, size)
 		try:
 			NVDAHelper.localLib.wasPlay_feed(
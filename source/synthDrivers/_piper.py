@@ -1,25 +1,205 @@
+import importlib.util
+import os
+import re
 import threading
-import queue
-from typing import Optional, Dict, Any
+from collections import OrderedDict, deque
+from typing import Optional, Dict, Any, List, Tuple, Union
 
 import nvwave
 from logHandler import log
 from synthDriverHandler import synthIndexReached, synthDoneSpeaking
 
-try:
-	from piper.config import SynthesisConfig
-	PIPER_AVAILABLE = True
-except ImportError:
-	SynthesisConfig = None
-	PIPER_AVAILABLE = False
+# Importing piper loads ONNX Runtime and numpy, which is slow.
+# Only check that it is installed here, and import it when it is first needed.
+PIPER_AVAILABLE = importlib.util.find_spec("piper") is not None
+if not PIPER_AVAILABLE:
 	log.warning("Piper TTS package not installed. Install with: pip install piper-tts")
 
+#: piper.config.SynthesisConfig, once imported by L{_getSynthesisConfig}.
+_SynthesisConfig = None
+
+
+def _getSynthesisConfig():
+	global _SynthesisConfig
+	if _SynthesisConfig is None:
+		from piper.config import SynthesisConfig
+
+		_SynthesisConfig = SynthesisConfig
+	return _SynthesisConfig
+
+
+#: Approximates where Piper splits text into sentences, each of which is synthesized as one audio chunk.
+_SENTENCE_END_RE = re.compile(r"[.!?]+(?:\s+|$)")
+
+
+#: Maximum number of open players kept in the pool, one per audio format.
+_MAX_POOLED_PLAYERS = 3
+
+#: (channels, samples per second, bits per sample) identifying a WavePlayer audio format.
+_PlayerKey = Tuple[int, int, int]
+
+#: Maximum number of items buffered between synthesis and playback.
+#: Piper produces one audio chunk per sentence, so this bounds how far synthesis can run ahead.
+_MAX_PLAYBACK_ITEMS = 4
+
+#: Maximum number of speech segments from earlier speak calls that BgThread may fall behind by.
+#: Beyond this, the oldest queued speech is skipped, though its indexes are still reported.
+#: Segments of the speech sequence being queued are never skipped.
+_MAX_QUEUED_ITEMS = 64
+
+# Types of messages handled by BgThread.
+_MSG_SPEAK = 0
+_MSG_INDEX = 1
+_MSG_WARMUP = 2
+
+# Types of messages handled by PlayerThread.
+_PLAY_AUDIO = 0
+_PLAY_INDEXES = 1
+_PLAY_DONE = 2
+
+
+#: Text synthesized and discarded after loading a voice to warm up the inference session.
+#: It must produce at least one phoneme, otherwise Piper skips inference entirely.
+_WARMUP_TEXT = "a"
+
+
+def _estimateChunkEnds(text: str) -> List[int]:
+	"""Estimate the character offset at which each audio chunk produced for text ends."""
+	return [m.end() for m in _SENTENCE_END_RE.finditer(text)]
+
+
+def _getAudioBuffer(audio_chunk) -> Union[bytes, memoryview]:
+	"""Get the int16 audio of a Piper audio chunk for feeding to a WavePlayer.
+	Where Piper exposes the underlying numpy array, a byte view of it is returned
+	so that the audio is not copied into a new bytes object.
+	"""
+	int16Array = getattr(audio_chunk, "audio_int16_array", None)
+	if int16Array is not None and int16Array.flags.c_contiguous:
+		return memoryview(int16Array).cast("B")
+	return audio_chunk.audio_int16_bytes
+
 
 def isPiperAvailable() -> bool:
 	"""Check if the Piper TTS package is available."""
 	return PIPER_AVAILABLE
 
 
+def importPiper():
+	"""Import the Piper TTS package, along with ONNX Runtime and numpy.
+	L{PIPER_AVAILABLE} only checks that the package is installed,
+	so this is needed to find out whether it actually works.
+	@raise Exception: If piper or one of its dependencies could not be imported.
+	"""
+	import piper  # noqa: F401
+
+
+#: States of a quantized model recorded in its sidecar.
+_QUANTIZED_VALID = "valid"
+_QUANTIZED_FAILED = "failed"
+
+
+def _getQuantizedPaths(model_path: str) -> Tuple[str, str]:
+	"""Get the paths of the quantized copy of a model and of its .mtime sidecar."""
+	root, ext = os.path.splitext(model_path)
+	quantizedPath = f"{root}.q8{ext}"
+	return quantizedPath, f"{quantizedPath}.mtime"
+
+
+def _getQuantizedState(model_path: str) -> Optional[str]:
+	"""Get the state of the quantized copy of a model recorded in its sidecar.
+	@return: L{_QUANTIZED_VALID} or L{_QUANTIZED_FAILED},
+		or None if nothing is recorded for the current version of the model.
+	"""
+	_quantizedPath, mtimePath = _getQuantizedPaths(model_path)
+	try:
+		sourceMtime = str(os.stat(model_path).st_mtime_ns)
+		with open(mtimePath, "r", encoding="utf-8") as f:
+			mtime, _sep, state = f.read().strip().partition(" ")
+	except OSError:
+		return None
+	if mtime != sourceMtime or state not in (_QUANTIZED_VALID, _QUANTIZED_FAILED):
+		return None
+	return state
+
+
+def _setQuantizedState(model_path: str, state: str):
+	"""Record the state of the quantized copy of a model, along with the modification time of the model."""
+	_quantizedPath, mtimePath = _getQuantizedPaths(model_path)
+	try:
+		sourceMtime = str(os.stat(model_path).st_mtime_ns)
+		with open(mtimePath, "w", encoding="utf-8") as f:
+			f.write(f"{sourceMtime} {state}")
+	except OSError:
+		log.debugWarning(f"Could not record quantized model for {model_path}", exc_info=True)
+
+
+def _removeFile(path: str):
+	try:
+		os.remove(path)
+	except FileNotFoundError:
+		pass
+	except OSError:
+		log.debugWarning(f"Could not delete {path}", exc_info=True)
+
+
+def getQuantizedModelPath(model_path: str) -> Optional[str]:
+	"""Get the path of a previously created quantized copy of a Piper model.
+	Quantized models are cached next to the original as <voice>.q8.onnx,
+	with a .mtime sidecar recording the modification time of the model it was made from
+	and whether it could be used.
+	The sidecar only marks a model as valid once it has been loaded successfully.
+	@return: The path of the quantized model, or None if there is no valid quantized model.
+	"""
+	quantizedPath, _mtimePath = _getQuantizedPaths(model_path)
+	if _getQuantizedState(model_path) == _QUANTIZED_VALID and os.path.isfile(quantizedPath):
+		return quantizedPath
+	return None
+
+
+def hasQuantizationFailed(model_path: str) -> bool:
+	"""Whether quantizing the current version of a model has already failed.
+	Quantization is not retried until the model changes.
+	"""
+	return _getQuantizedState(model_path) == _QUANTIZED_FAILED
+
+
+def quantizeModel(model_path: str) -> Optional[str]:
+	"""Create a dynamically quantized copy of a Piper model.
+	This can take several seconds, so should not be called on the main thread.
+	The copy is not used by L{getQuantizedModelPath} until L{markQuantizedModelValid} is called.
+	On failure, any partially written copy is deleted and the failure is recorded.
+	@return: The path of the quantized model, or None if quantization failed.
+	"""
+	quantizedPath, _mtimePath = _getQuantizedPaths(model_path)
+	try:
+		from onnxruntime.quantization import quantize_dynamic, QuantType
+
+		log.info(f"Quantizing Piper model: {model_path}")
+		# Piper's VITS models are mostly Conv layers.
+		# With signed int8 weights these become ConvInteger nodes,
+		# which the ONNX Runtime CPU execution provider does not implement.
+		quantize_dynamic(model_path, quantizedPath, weight_type=QuantType.QUInt8)
+	except Exception as e:
+		log.error(f"Failed to quantize Piper model {model_path}: {e}")
+		discardQuantizedModel(model_path)
+		return None
+	return quantizedPath
+
+
+def markQuantizedModelValid(model_path: str):
+	"""Record that the quantized copy of a model loads, so that it is reused by later loads."""
+	_setQuantizedState(model_path, _QUANTIZED_VALID)
+
+
+def discardQuantizedModel(model_path: str):
+	"""Delete a quantized copy of a model which could not be created or loaded.
+	The failure is recorded, so that quantization is not retried until the model changes.
+	"""
+	quantizedPath, _mtimePath = _getQuantizedPaths(model_path)
+	_removeFile(quantizedPath)
+	_setQuantizedState(model_path, _QUANTIZED_FAILED)
+
+
 def loadVoice(
 	model_path: str,
 	config_path: str,
@@ -32,6 +212,7 @@ def loadVoice(
 		return None
 	try:
 		from piper import PiperVoice
+
 		voice = PiperVoice.load(
 			model_path=model_path,
 			config_path=config_path,
@@ -46,115 +227,243 @@ def loadVoice(
 
 
 class BgThread(threading.Thread):
+	"""Synthesizes queued speech, handing the audio to a L{PlayerThread} for playback.
+	This lets synthesis of the next utterance overlap playback of the current one.
+	"""
+
 	def __init__(self, synth):
 		super().__init__(daemon=True)
 		self._synth = synth
-		self._queue: queue.Queue = queue.Queue()
-		self._running = True
+		# Pending items, appended by the speaking thread and consumed by this one.
+		# deque.append and deque.popleft are atomic, so no lock is needed around them.
+		self._deque: deque = deque()
+		#: Sequence number of the next speech segment queued. Only written by the speaking thread.
+		self._nextSegmentSeq = 0
+		#: Sequence number of the first segment of the latest speak call. Only written by the speaking thread.
+		self._batchStartSeq = 0
+		self._wake = threading.Event()
+		#: Set when the thread is asked to stop; also aborts any synthesis in progress.
+		self._stopEvent = threading.Event()
 		self._cancelled = False
-		self._player: Optional[nvwave.WavePlayer] = None
-		self._playerSampleRate: Optional[int] = None
-		self._playerLock = threading.Lock()
+		self._playThread = PlayerThread(synth)
+		# The synthesis config of the previous utterance, reused while its parameters are unchanged.
+		self._lastConfigKey: Optional[Tuple] = None
+		self._lastConfig = None
 
 	def run(self):
-		while self._running:
-			try:
-				item = self._queue.get(timeout=0.1)
-			except queue.Empty:
-				continue
-
-			if item is None:
-				# Shutdown signal
+		self._playThread.start()
+		while not self._stopEvent.is_set():
+			# Block until there is work; stop() wakes us with the None sentinel.
+			self._wake.wait()
+			self._wake.clear()
+			if not self._processPending():
 				break
 
-			try:
-				self._processItem(item)
-			except Exception as e:
-				log.error(f"Piper synthesis error: {e}")
-
-		self._closePlayer()
+		self._playThread.stop()
+		self._playThread.join()
 
-	def _processItem(self, item):
-		if isinstance(item, tuple):
-			cmd, data = item
-			if cmd == "speak":
-				self._speak(data)
-			elif cmd == "index":
-				synthIndexReached.notify(synth=self._synth, index=data)
+	def _processPending(self) -> bool:
+		"""Process all pending items.
+		@return: False if the shutdown sentinel was reached, True otherwise.
+		"""
+		# Indexes from consecutive index messages and skipped speech, reported to the player together.
+		indexes: List[int] = []
+		indexesGeneration: Optional[int] = None
+		skipped = 0
+		try:
+			while True:
+				try:
+					item = self._deque.popleft()
+				except IndexError:
+					# queueCancel may empty the deque at any time.
+					return True
+				if item is None:
+					# Shutdown signal
+					return False
+
+				msgType, payload = item
+				if msgType == _MSG_SPEAK and self._batchStartSeq - payload["seq"] > _MAX_QUEUED_ITEMS:
+					# Synthesis has fallen too far behind: skip speech from earlier speak calls,
+					# but still report its indexes so that speech sequencing is not stalled.
+					skipped += 1
+					msgType = _MSG_INDEX
+					payload = ([index for _offset, index in payload["indexes"]], payload["generation"])
+				if msgType == _MSG_INDEX:
+					newIndexes, generation = payload
+					if generation != indexesGeneration:
+						self._doIndex((indexes, indexesGeneration))
+						indexes = []
+						indexesGeneration = generation
+					indexes.extend(newIndexes)
+					continue
+				self._doIndex((indexes, indexesGeneration))
+				indexes = []
+				try:
+					_SYNTH_HANDLERS[msgType](self, payload)
+				except Exception as e:
+					log.error(f"Piper synthesis error: {e}")
+		finally:
+			self._doIndex((indexes, indexesGeneration))
+			if skipped:
+				log.debugWarning(f"Piper synthesis backlog full, skipped {skipped} queued segments")
+
+	def _doIndex(self, data: Tuple[List[int], Optional[int]]):
+		indexes, generation = data
+		if indexes:
+			self._playThread.put((_PLAY_INDEXES, indexes), generation)
+
+	def _warmup(self, voice):
+		"""Run a throwaway synthesis so that ONNX Runtime initializes its session
+		before the first real utterance. The audio produced is discarded.
+		Skipped if the voice has been replaced since the warmup was queued.
+		"""
+		if not PIPER_AVAILABLE or voice is not self._synth._currentVoice:
+			return
+		try:
+			for _audio_chunk in voice.synthesize(
+				_WARMUP_TEXT,
+				_getSynthesisConfig()(),
+				cancelled_callback=self._stopEvent.is_set,
+			):
+				pass
+		except Exception as e:
+			log.debugWarning(f"Piper voice warmup failed: {e}")
 
 	def _speak(self, data: Dict[str, Any]):
 		text = data.get("text", "")
-		if not text.strip():
-			return
+		generation = data["generation"]
+		# Index commands coalesced into this segment, as (character offset, index) pairs.
+		# They are reported once the audio chunk estimated to contain their offset has played.
+		pendingIndexes: List[Tuple[int, int]] = list(data.get("indexes", ()))
 
 		voice = self._synth._currentVoice
+		# SynthDriver.speak only queues segments containing non-whitespace text.
 		if voice is None:
+			# Nothing to synthesize with, but index commands must still be reported.
+			self._playThread.put((_PLAY_INDEXES, [index for _offset, index in pendingIndexes]), generation)
 			return
 
 		if not PIPER_AVAILABLE:
 			log.error("Cannot synthesize: Piper TTS package not available")
+			self._playThread.put((_PLAY_INDEXES, [index for _offset, index in pendingIndexes]), generation)
 			return
 
 		# Clear cancelled flag at start of new speech
 		self._cancelled = False
 
-		syn_config = SynthesisConfig(
-			speaker_id=data.get("speaker_id"),
-			length_scale=data.get("length_scale", 1.0),
-			noise_scale=data.get("noise_scale", 0.667),
-			noise_w_scale=data.get("noise_w_scale", 0.8),
-			volume=data.get("volume", 1.0),
+		# Indexes at the start of the segment have been reached before any of its audio plays.
+		leadingIndexes = []
+		while pendingIndexes and pendingIndexes[0][0] <= 0:
+			leadingIndexes.append(pendingIndexes.pop(0)[1])
+		if leadingIndexes and not self._playThread.put((_PLAY_INDEXES, leadingIndexes), generation):
+			return
+
+		chunkEnds = _estimateChunkEnds(text)
+		chunkNum = 0
+
+		configKey = (
+			data.get("speaker_id"),
+			data.get("length_scale", 1.0),
+			data.get("noise_scale", 0.667),
+			data.get("noise_w_scale", 0.8),
+			data.get("volume", 1.0),
 		)
+		if configKey == self._lastConfigKey:
+			syn_config = self._lastConfig
+		else:
+			speaker_id, length_scale, noise_scale, noise_w_scale, volume = configKey
+			syn_config = _getSynthesisConfig()(
+				speaker_id=speaker_id,
+				length_scale=length_scale,
+				noise_scale=noise_scale,
+				noise_w_scale=noise_w_scale,
+				volume=volume,
+			)
+			self._lastConfigKey = configKey
+			self._lastConfig = syn_config
 
 		try:
-			for audio_chunk in voice.synthesize(text, syn_config, cancelled_callback=lambda: (not self._running) or self._cancelled):
-				if not self._running or self._cancelled:
+			for audio_chunk in voice.synthesize(text, syn_config, cancelled_callback=self._isCancelled):
+				if self._isCancelled():
 					break
 
-				with self._playerLock:
-					if self._cancelled:
-						break
-
-					if self._player is None or self._playerSampleRate != audio_chunk.sample_rate:
-						self._closePlayerUnlocked()
-						self._player = nvwave.WavePlayer(
-							channels=audio_chunk.sample_channels,
-							samplesPerSec=audio_chunk.sample_rate,
-							bitsPerSample=audio_chunk.sample_width * 8,
-						)
-						self._playerSampleRate = audio_chunk.sample_rate
-
-					self._player.feed(audio_chunk.audio_int16_bytes)
-
-			with self._playerLock:
-				if self._player and not self._cancelled:
-					self._player.idle()
+				# Chunks beyond the estimated sentence boundaries leave their indexes for the end of the segment.
+				chunkEnd = chunkEnds[chunkNum] if chunkNum < len(chunkEnds) else -1
+				chunkNum += 1
+				reached = []
+				while pendingIndexes and pendingIndexes[0][0] <= chunkEnd:
+					reached.append(pendingIndexes.pop(0)[1])
+				key = (
+					audio_chunk.sample_channels,
+					audio_chunk.sample_rate,
+					audio_chunk.sample_width * 8,
+				)
+				if not self._playThread.put(
+					(_PLAY_AUDIO, (key, _getAudioBuffer(audio_chunk), reached)), generation
+				):
+					# Cancelled while waiting for the player to catch up.
+					return
 
 		except Exception as e:
 			log.error(f"Piper synthesis failed: {e}")
 
-		if not self._cancelled:
-			synthDoneSpeaking.notify(synth=self._synth)
-
-	def _closePlayerUnlocked(self):
-		"""Close the player without acquiring the lock. Caller must hold _playerLock."""
-		if self._player:
-			try:
-				self._player.close()
-			except Exception:
-				pass
-			self._player = None
-			self._playerSampleRate = None
-
-	def _closePlayer(self):
-		with self._playerLock:
-			self._closePlayerUnlocked()
-
-	def queueSpeak(self, text: str, **kwargs):
-		self._queue.put(("speak", {"text": text, **kwargs}))
+		if self._cancelled:
+			return
+		remainingIndexes = [index for _offset, index in pendingIndexes]
+		if data.get("final", True):
+			# Only wait for playback and report that speaking is done after the whole speech sequence.
+			self._playThread.put((_PLAY_DONE, remainingIndexes), generation)
+		elif remainingIndexes:
+			self._playThread.put((_PLAY_INDEXES, remainingIndexes), generation)
+
+	def _isCancelled(self) -> bool:
+		return self._cancelled or self._stopEvent.is_set()
+
+	def _put(self, item):
+		self._deque.append(item)
+		self._wake.set()
+
+	def startBatch(self):
+		"""Called before queueing the segments of a new speech sequence.
+		Once synthesis falls more than L{_MAX_QUEUED_ITEMS} segments of earlier sequences behind,
+		the oldest of them are skipped. Segments of this and later sequences are not affected.
+		"""
+		self._batchStartSeq = self._nextSegmentSeq
+
+	def queueSpeak(
+		self,
+		text: str,
+		indexes: Optional[List[Tuple[int, int]]] = None,
+		final: bool = True,
+		**kwargs,
+	):
+		"""Queue text for synthesis.
+		@param indexes: (character offset, index) pairs for index commands within text,
+			reported as the corresponding audio finishes playing.
+		@param final: Whether this is the last segment of a speech sequence.
+			Only then is playback drained and synthDoneSpeaking notified once it has played.
+		"""
+		self._put(
+			(
+				_MSG_SPEAK,
+				{
+					"text": text,
+					"indexes": indexes or [],
+					"final": final,
+					"generation": self._playThread.generation,
+					"seq": self._nextSegmentSeq,
+					**kwargs,
+				},
+			),
+		)
+		self._nextSegmentSeq += 1
 
 	def queueIndex(self, index: int):
-		self._queue.put(("index", index))
+		self._put((_MSG_INDEX, ([index], self._playThread.generation)))
+
+	def queueWarmup(self, voice):
+		"""Queue a silent warmup synthesis for a freshly loaded voice."""
+		self._put((_MSG_WARMUP, voice))
 
 	def queueCancel(self):
 		"""Immediately cancel all pending and current speech.
@@ -163,26 +472,183 @@ def queueCancel(self):
 		immediate cancellation by:
 		1. Setting the cancelled flag to stop synthesis loops
 		2. Clearing all pending items from the queue
-		3. Immediately stopping audio playback
+		3. Discarding buffered audio and immediately stopping playback
 		"""
 		# Set flag first to stop any ongoing synthesis
 		self._cancelled = True
 
 		# Clear the queue of pending items
-		try:
-			while True:
-				self._queue.get_nowait()
-		except queue.Empty:
-			pass
+		self._deque.clear()
+
+		self._playThread.cancel()
+
+	def stop(self):
+		"""Stop the thread, aborting any synthesis and playback in progress."""
+		self._stopEvent.set()
+		# Unblock synthesis waiting for buffer space and silence playback.
+		self._playThread.cancel()
+		self._put(None)
+
+
+class PlayerThread(threading.Thread):
+	"""Plays audio produced by L{BgThread} and reports indexes as it is played.
 
-		# Immediately stop the audio player
+	Items are queued with the cancellation generation current when the speech was queued.
+	Cancelling starts a new generation, so items from earlier generations are discarded
+	even if they were already in flight.
+	"""
+
+	def __init__(self, synth):
+		super().__init__(daemon=True)
+		self._synth = synth
+		self._items: deque = deque()
+		#: Guards _items and generation, and signals when items are added or removed.
+		self._itemsCond = threading.Condition()
+		#: Incremented each time speech is cancelled.
+		self.generation = 0
+		#: Open players keyed by audio format, least recently used first.
+		#: Reusing them avoids reopening the audio device when switching between voices.
+		self._playerPool: "OrderedDict[_PlayerKey, nvwave.WavePlayer]" = OrderedDict()
+		self._activePlayerKey: Optional[_PlayerKey] = None
+		self._playerLock = threading.Lock()
+
+	def run(self):
+		while True:
+			with self._itemsCond:
+				while not self._items:
+					self._itemsCond.wait()
+				item = self._items.popleft()
+				# Wake the synthesis thread if it is waiting for space.
+				self._itemsCond.notify_all()
+			if item is None:
+				# Shutdown signal
+				break
+
+			msgType, payload, generation = item
+			try:
+				_PLAY_HANDLERS[msgType](self, payload, generation)
+			except Exception as e:
+				log.error(f"Piper playback error: {e}")
+
+		self._closePlayer()
+
+	def _playAudio(self, data: Tuple[_PlayerKey, Union[bytes, memoryview], List[int]], generation: int):
+		key, audio, indexes = data
 		with self._playerLock:
-			if self._player:
+			if generation != self.generation:
+				return
+			previous = None
+			if self._activePlayerKey is not None and self._activePlayerKey != key:
+				previous = self._playerPool.get(self._activePlayerKey)
+		if previous:
+			# Make sure audio in the previous format has finished before switching.
+			# Wait without holding the lock, so that cancel can stop the player.
+			previous.idle()
+		with self._playerLock:
+			if generation != self.generation:
+				return
+			player = self._getPlayerUnlocked(key)
+			player.feed(
+				audio,
+				onDone=(lambda: self._notifyIndexes(indexes)) if indexes else None,
+			)
+
+	def _playIndexes(self, indexes: List[int], generation: int):
+		if generation == self.generation:
+			self._notifyIndexes(indexes)
+
+	def _playDone(self, indexes: List[int], generation: int):
+		with self._playerLock:
+			player = self._playerPool.get(self._activePlayerKey)
+		# Wait for playback without holding the lock, so that cancel can stop the player.
+		if player and generation == self.generation:
+			player.idle()
+		if generation == self.generation:
+			self._notifyIndexes(indexes)
+			synthDoneSpeaking.notify(synth=self._synth)
+
+	def _notifyIndexes(self, indexes):
+		for index in indexes:
+			synthIndexReached.notify(synth=self._synth, index=index)
+
+	def put(self, item: Tuple[int, Any], generation: int) -> bool:
+		"""Queue an item for playback, blocking while the buffer is full.
+		@return: False if the item was discarded because speech was cancelled.
+		"""
+		with self._itemsCond:
+			while len(self._items) >= _MAX_PLAYBACK_ITEMS and generation == self.generation:
+				self._itemsCond.wait()
+			if generation != self.generation:
+				return False
+			self._items.append((*item, generation))
+			self._itemsCond.notify_all()
+		return True
+
+	def cancel(self):
+		"""Discard buffered audio and immediately stop playback."""
+		with self._itemsCond:
+			self.generation += 1
+			self._items.clear()
+			self._itemsCond.notify_all()
+
+		with self._playerLock:
+			player = self._playerPool.get(self._activePlayerKey)
+			if player:
 				try:
-					self._player.stop()
+					player.stop()
 				except Exception:
 					pass
 
 	def stop(self):
-		self._running = False
-		self._queue.put(None)
+		with self._itemsCond:
+			self._items.append(None)
+			self._itemsCond.notify_all()
+
+	def _getPlayerUnlocked(self, key: _PlayerKey) -> nvwave.WavePlayer:
+		"""Get a player for the given audio format from the pool, creating it if necessary,
+		and make it the active player. Caller must hold _playerLock.
+		"""
+		player = self._playerPool.get(key)
+		if player is None:
+			channels, samplesPerSec, bitsPerSample = key
+			player = nvwave.WavePlayer(
+				channels=channels,
+				samplesPerSec=samplesPerSec,
+				bitsPerSample=bitsPerSample,
+			)
+			self._playerPool[key] = player
+			while len(self._playerPool) > _MAX_POOLED_PLAYERS:
+				_oldKey, oldPlayer = self._playerPool.popitem(last=False)
+				self._closePlayerUnlocked(oldPlayer)
+		else:
+			self._playerPool.move_to_end(key)
+		self._activePlayerKey = key
+		return player
+
+	@staticmethod
+	def _closePlayerUnlocked(player: nvwave.WavePlayer):
+		"""Close a player without acquiring the lock. Caller must hold _playerLock."""
+		try:
+			player.close()
+		except Exception:
+			pass
+
+	def _closePlayer(self):
+		"""Close all pooled players."""
+		with self._playerLock:
+			for player in self._playerPool.values():
+				self._closePlayerUnlocked(player)
+			self._playerPool.clear()
+			self._activePlayerKey = None
+
+
+_SYNTH_HANDLERS = {
+	_MSG_SPEAK: BgThread._speak,
+	_MSG_WARMUP: BgThread._warmup,
+}
+
+_PLAY_HANDLERS = {
+	_PLAY_AUDIO: PlayerThread._playAudio,
+	_PLAY_INDEXES: PlayerThread._playIndexes,
+	_PLAY_DONE: PlayerThread._playDone,
+}
@@ -1,11 +1,14 @@
+import json
 import os
+import threading
 from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Set, Tuple
 
 from autoSettingsUtils.driverSetting import NumericDriverSetting, BooleanDriverSetting
 from autoSettingsUtils.utils import StringParameterInfo
 from logHandler import log
+import queueHandler
 from speech.commands import (
 	IndexCommand,
 	CharacterModeCommand,
@@ -17,10 +20,53 @@
 )
 import synthDriverHandler
 from synthDriverHandler import VoiceInfo, synthIndexReached, synthDoneSpeaking
-from ._piper import BgThread, isPiperAvailable, loadVoice
+from ._piper import (
+	BgThread,
+	discardQuantizedModel,
+	getQuantizedModelPath,
+	hasQuantizationFailed,
+	importPiper,
+	isPiperAvailable,
+	loadVoice,
+	markQuantizedModelValid,
+	quantizeModel,
+)
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
 
 
 DEFAULT_VOICE_DIR = os.path.join(os.path.dirname(__file__), "piper_voices")
+#: Minimum number of characters to accumulate before handing a segment to Piper.
+#: Each synthesis call carries a fixed inference overhead,
+#: so short fragments between index commands are coalesced into one segment.
+_MIN_SEGMENT_CHARS = 40
+#: Name of the file in the voice directory caching the parsed voice configurations.
+#: It is reused as long as no voice file has been added, removed or modified.
+_VOICE_INDEX_FILENAME = ".index.json"
+#: Keys every voice in the index must have.
+#: Voices are stored by file name rather than path, so the index stays valid if the directory is moved.
+_VOICE_INDEX_KEYS = frozenset({"name", "language", "fileName"})
+#: Shared default for missing sections of a voice config. Only ever read from.
+_EMPTY: Dict[str, Any] = {}
+
+
+def _isValidIndexEntry(info: Any, fileMtimes: Dict[str, int]) -> bool:
+	"""Check that a voice read from the voice index is well formed and refers to a current voice model."""
+	if not isinstance(info, dict) or not _VOICE_INDEX_KEYS <= info.keys():
+		return False
+	fileName = info["fileName"]
+	return isinstance(fileName, str) and fileName.endswith(".onnx") and fileName in fileMtimes
+
+
+def _loadJson(path: Path) -> Dict[str, Any]:
+	# Voice configs are small, so read them in one call rather than through a text stream.
+	data = path.read_bytes()
+	if orjson is not None:
+		return orjson.loads(data)
+	return json.loads(data.decode("utf-8"))
 
 
 class SynthDriver(synthDriverHandler.SynthDriver):
@@ -40,6 +86,18 @@ class SynthDriver(synthDriverHandler.SynthDriver):
 			_("Use enhanced &Persian phonemizer"),
 			defaultVal=False,
 		),
+		BooleanDriverSetting(
+			"useGpu",
+			# Translators: This is the label for a setting in voice settings dialog.
+			_("Use &GPU (CUDA) for synthesis"),
+			defaultVal=False,
+		),
+		BooleanDriverSetting(
+			"quantize",
+			# Translators: This is the label for a setting in voice settings dialog.
+			_("Use &quantized (int8) voice models"),
+			defaultVal=False,
+		),
 	)
 
 	supportedCommands = {
@@ -63,6 +121,10 @@ def __init__(self):
 
 		if not isPiperAvailable():
 			raise RuntimeError("Piper TTS package not available")
+		try:
+			importPiper()
+		except Exception as e:
+			raise RuntimeError("Piper TTS package could not be imported") from e
 
 		self._voiceDir = Path(os.environ.get("PIPER_VOICE_DIR", DEFAULT_VOICE_DIR))
 		self._ezafeModelPath = os.environ.get("PIPER_EZAFE_MODEL_PATH")
@@ -71,12 +133,19 @@ def __init__(self):
 		self._loadedVoices: Dict[str, Any] = {}
 		self._currentVoice: Optional[Any] = None
 		self._currentVoiceId: str = ""
+		#: The voice for which the cached availableVariants were built.
+		self._availableVariantsVoiceId: Optional[str] = None
 
 		self._rate = 50
 		self._pitch = 50
 		self._volume = 100
 		self._variant = "0"
+		self._speakerId = 0
 		self._usePersianPhonemizer = True
+		self._useGpu = False
+		self._quantize = False
+		#: Voices whose models are being quantized in the background.
+		self._quantizingVoiceIds: Set[str] = set()
 
 		self._bgThread: Optional[BgThread] = None
 
@@ -103,6 +172,10 @@ def terminate(self):
 
 	def _scanVoices(self):
 		self._voiceData.clear()
+		# Invalidate the voices and variants cached by availableVoices and availableVariants.
+		if hasattr(self, "_availableVoices"):
+			del self._availableVoices
+		self._availableVariantsVoiceId = None
 
 		if not self._voiceDir.exists():
 			log.warning(f"Piper voice directory does not exist: {self._voiceDir}")
@@ -112,27 +185,43 @@ def _scanVoices(self):
 				log.error(f"Could not create voice directory: {e}")
 			return
 
-		import json
+		with os.scandir(self._voiceDir) as entries:
+			fileEntries = {entry.name: entry for entry in entries if entry.is_file()}
+		modelNames = sorted(
+			name for name in fileEntries if name.endswith(".onnx") and f"{name}.json" in fileEntries
+		)
+		# Modification times of every voice file, identifying the state the index was built from.
+		# DirEntry.stat is served from the directory listing on Windows, so this does not open the files.
+		fileMtimes = {}
+		for fileName in modelNames:
+			for name in (fileName, f"{fileName}.json"):
+				fileMtimes[name] = fileEntries[name].stat().st_mtime_ns
+
+		indexPath = self._voiceDir / _VOICE_INDEX_FILENAME
+		if self._readVoiceIndex(indexPath, fileMtimes):
+			log.info(f"Found {len(self._voiceData)} Piper voice(s) (cached)")
+			self._addVoiceInfos()
+			return
 
-		for onnx_path in self._voiceDir.glob("*.onnx"):
-			config_path = Path(f"{onnx_path}.json")
-			if not config_path.exists():
-				continue
+		for fileName in modelNames:
+			onnx_path = self._voiceDir / fileName
+			config_path = self._voiceDir / f"{fileName}.json"
 
 			voice_id = onnx_path.stem
 			try:
-				with open(config_path, "r", encoding="utf-8") as f:
-					config = json.load(f)
+				config = _loadJson(config_path)
 
-				espeak_voice = config.get("espeak", {}).get("voice", "en")
-				lang = espeak_voice.split("-")[0] if "-" in espeak_voice else espeak_voice
+				espeak = config.get("espeak") or _EMPTY
+				audio = config.get("audio") or _EMPTY
+				espeak_voice = espeak.get("voice", "en")
+				lang = espeak_voice.partition("-")[0]
 
 				self._voiceData[voice_id] = {
 					"name": voice_id,
 					"language": lang,
 					"path": str(onnx_path),
 					"config_path": str(config_path),
-					"sample_rate": config.get("audio", {}).get("sample_rate", 22050),
+					"sample_rate": audio.get("sample_rate", 22050),
 					"num_speakers": config.get("num_speakers", 1),
 					"speaker_id_map": config.get("speaker_id_map", {}),
 					"espeak_voice": espeak_voice,
@@ -143,6 +232,54 @@ def _scanVoices(self):
 				log.warning(f"Could not load voice config {config_path}: {e}")
 
 		log.info(f"Found {len(self._voiceData)} Piper voice(s)")
+		self._writeVoiceIndex(indexPath, fileMtimes)
+		self._addVoiceInfos()
+
+	def _addVoiceInfos(self):
+		"""Build the VoiceInfo of each voice once, to be reused by availableVoices.
+		They are added after the voice index is written, so they are never serialized.
+		"""
+		for voice_id, info in self._voiceData.items():
+			info["voice_info"] = VoiceInfo(voice_id, info["name"], info["language"])
+
+	def _readVoiceIndex(self, indexPath: Path, fileMtimes: Dict[str, int]) -> bool:
+		"""Populate voice data from the cached index if it matches the voice files.
+		@param fileMtimes: The modification time of each voice file, keyed by file name.
+		@return: Whether the cached index was used.
+		"""
+		try:
+			index = _loadJson(indexPath)
+		except FileNotFoundError:
+			return False
+		except Exception:
+			log.debugWarning("Could not read Piper voice index", exc_info=True)
+			return False
+		if not isinstance(index, dict) or index.get("files") != fileMtimes:
+			return False
+		voices = index.get("voices")
+		if not isinstance(voices, dict) or not all(
+			_isValidIndexEntry(info, fileMtimes) for info in voices.values()
+		):
+			log.debugWarning("Ignoring malformed Piper voice index")
+			return False
+		for voice_id, info in voices.items():
+			fileName = info.pop("fileName")
+			info["path"] = str(self._voiceDir / fileName)
+			info["config_path"] = str(self._voiceDir / f"{fileName}.json")
+			self._voiceData[voice_id] = info
+		return True
+
+	def _writeVoiceIndex(self, indexPath: Path, fileMtimes: Dict[str, int]):
+		voices = {}
+		for voice_id, info in self._voiceData.items():
+			entry = {key: value for key, value in info.items() if key not in ("path", "config_path")}
+			entry["fileName"] = os.path.basename(info["path"])
+			voices[voice_id] = entry
+		try:
+			with open(indexPath, "w", encoding="utf-8") as f:
+				json.dump({"files": fileMtimes, "voices": voices}, f)
+		except OSError:
+			log.debugWarning("Could not write Piper voice index", exc_info=True)
 
 	def _loadVoice(self, voice_id: str) -> Optional[Any]:
 		if voice_id in self._loadedVoices:
@@ -153,23 +290,84 @@ def _loadVoice(self, voice_id: str) -> Optional[Any]:
 			log.error(f"Voice not found: {voice_id}")
 			return None
 
+		voice = None
+		# int8 kernels only benefit CPU inference.
+		if self._quantize and not self._useGpu:
+			quantizedPath = getQuantizedModelPath(voice_info["path"])
+			if quantizedPath:
+				voice = self._loadVoiceModel(voice_info, quantizedPath)
+				if voice is None:
+					log.warning(f"Could not load quantized model for {voice_id}, using the original")
+					discardQuantizedModel(voice_info["path"])
+			elif not hasQuantizationFailed(voice_info["path"]):
+				# Quantizing takes seconds, so speak with the original model until it is done.
+				self._quantizeInBackground(voice_id)
+		if voice is None:
+			voice = self._loadVoiceModel(voice_info, voice_info["path"])
+		if voice:
+			self._loadedVoices[voice_id] = voice
+			log.info(f"Loaded Piper voice: {voice_id}")
+		return voice
+
+	def _loadVoiceModel(self, voice_info: Dict[str, Any], model_path: str) -> Optional[Any]:
 		try:
-			voice = loadVoice(
-				model_path=voice_info["path"],
+			return loadVoice(
+				model_path=model_path,
 				config_path=voice_info["config_path"],
-				use_cuda=False,
+				use_cuda=self._useGpu,
 				use_persian_phonemizer=self._usePersianPhonemizer,
 				ezafe_model_path=self._ezafeModelPath,
 			)
-			if voice:
-				self._loadedVoices[voice_id] = voice
-				log.info(f"Loaded Piper voice: {voice_id}")
-			return voice
-
 		except Exception as e:
-			log.error(f"Failed to load voice {voice_id}: {e}")
+			log.error(f"Failed to load voice {voice_info['name']}: {e}")
 			return None
 
+	def _getLoadSettings(self) -> Tuple[bool, bool, bool]:
+		"""The settings which affect how a voice is loaded."""
+		return (self._usePersianPhonemizer, self._useGpu, self._quantize)
+
+	def _quantizeInBackground(self, voice_id: str):
+		if voice_id in self._quantizingVoiceIds:
+			return
+		self._quantizingVoiceIds.add(voice_id)
+		threading.Thread(
+			target=self._quantizeVoice,
+			args=(voice_id, self._voiceData[voice_id], self._getLoadSettings()),
+			name=f"{self.__class__.__module__}.quantize",
+			daemon=True,
+		).start()
+
+	def _quantizeVoice(
+		self, voice_id: str, voice_info: Dict[str, Any], loadSettings: Tuple[bool, bool, bool]
+	):
+		"""Quantize a voice model and load it. Runs on a background thread."""
+		voice = None
+		try:
+			model_path = voice_info["path"]
+			quantizedPath = quantizeModel(model_path)
+			if quantizedPath:
+				voice = self._loadVoiceModel(voice_info, quantizedPath)
+				if voice is None:
+					log.error(f"Could not load quantized model for {voice_id}, keeping the original")
+					discardQuantizedModel(model_path)
+				else:
+					markQuantizedModelValid(model_path)
+		finally:
+			queueHandler.queueFunction(
+				queueHandler.eventQueue, self._onVoiceQuantized, voice_id, voice, loadSettings
+			)
+
+	def _onVoiceQuantized(self, voice_id: str, voice: Optional[Any], loadSettings: Tuple[bool, bool, bool]):
+		"""Switch to a voice quantized in the background. Runs on the main thread."""
+		self._quantizingVoiceIds.discard(voice_id)
+		if voice is None or not self._bgThread or loadSettings != self._getLoadSettings():
+			# Quantization failed, the driver was terminated, or the settings changed meanwhile.
+			return
+		self._loadedVoices[voice_id] = voice
+		if voice_id == self._currentVoiceId:
+			self._currentVoice = voice
+			self._warmUpCurrentVoice()
+
 	def _get_voice(self) -> str:
 		return self._currentVoiceId
 
@@ -182,23 +380,59 @@ def _set_voice(self, voice_id: str):
 			self._currentVoice = voice
 			self._currentVoiceId = voice_id
 			self._variant = "0"
+			self._speakerId = 0
+			self._warmUpCurrentVoice()
+
+	def _setLoadSetting(self, name: str, value: bool):
+		"""Change a setting affecting how voices are loaded, and reload the current voice with it.
+		If the voice cannot be loaded with the new setting, the setting is reverted
+		and the previously loaded voices are kept, so that speech is not lost.
+		@param name: The name of the attribute holding the setting.
+		"""
+		oldValue = getattr(self, name)
+		if value == oldValue:
+			return
+		oldLoadedVoices = dict(self._loadedVoices)
+		setattr(self, name, value)
+		# Loaded voices were created with the previous setting.
+		self._loadedVoices.clear()
+		if not self._currentVoiceId:
+			return
+		voice = self._loadVoice(self._currentVoiceId)
+		if voice is None:
+			log.error(f"Could not load Piper voice {self._currentVoiceId} with {name}={value}, reverting")
+			setattr(self, name, oldValue)
+			self._loadedVoices.update(oldLoadedVoices)
+			return
+		self._currentVoice = voice
+		self._warmUpCurrentVoice()
+
+	def _warmUpCurrentVoice(self):
+		# Pay the inference session's cold start cost now rather than on the first utterance.
+		# Only the current voice is warmed up, as voices loaded during startup are often replaced straight away.
+		if self._bgThread and self._currentVoice:
+			self._bgThread.queueWarmup(self._currentVoice)
 
 	def _getAvailableVoices(self) -> OrderedDict:
 		"""Get available voices."""
-		voices = OrderedDict()
-		for voice_id, info in sorted(self._voiceData.items()):
-			voices[voice_id] = VoiceInfo(
-				voice_id,
-				info["name"],
-				info["language"],
-			)
-		return voices
+		return OrderedDict(
+			(voice_id, self._voiceData[voice_id]["voice_info"]) for voice_id in sorted(self._voiceData)
+		)
 
 	def _get_variant(self) -> str:
 		return self._variant
 
 	def _set_variant(self, variant: str):
 		self._variant = variant
+		self._speakerId = int(variant) if variant.isdigit() else 0
+
+	def _get_availableVariants(self) -> OrderedDict:
+		# Variants depend on the current voice,
+		# so the single value cached by the base class must be rebuilt when the voice changes.
+		if self._availableVariantsVoiceId != self._currentVoiceId or not hasattr(self, "_availableVariants"):
+			self._availableVariants = self._getAvailableVariants()
+			self._availableVariantsVoiceId = self._currentVoiceId
+		return self._availableVariants
 
 	def _getAvailableVariants(self) -> OrderedDict:
 		variants = OrderedDict()
@@ -241,11 +475,19 @@ def _get_usePersianPhonemizer(self) -> bool:
 		return self._usePersianPhonemizer
 
 	def _set_usePersianPhonemizer(self, value: bool):
-		self._usePersianPhonemizer = value
-		if self._currentVoiceId:
-			if self._currentVoiceId in self._loadedVoices:
-				del self._loadedVoices[self._currentVoiceId]
-			self._currentVoice = self._loadVoice(self._currentVoiceId)
+		self._setLoadSetting("_usePersianPhonemizer", value)
+
+	def _get_useGpu(self) -> bool:
+		return self._useGpu
+
+	def _set_useGpu(self, value: bool):
+		self._setLoadSetting("_useGpu", value)
+
+	def _get_quantize(self) -> bool:
+		return self._quantize
+
+	def _set_quantize(self, value: bool):
+		self._setLoadSetting("_quantize", value)
 
 	def _rateToLengthScale(self, rate: int) -> float:
 		# rate 0 -> length_scale 2.0 (slowest)
@@ -260,42 +502,91 @@ def speak(self, speechSequence: list):
 		if not self._bgThread or not self._currentVoice:
 			return
 
+		self._bgThread.startBatch()
+		# Bind frequently used names locally; this loop runs for every speech sequence.
+		queueSpeak = self._bgThread.queueSpeak
+		queueIndex = self._bgThread.queueIndex
+		speakerId = self._speakerId
+		_IndexCommand = IndexCommand
+		_RateCommand = RateCommand
+		_VolumeCommand = VolumeCommand
+		_BreakCommand = BreakCommand
+
 		textParts = []
-		currentRate = self._rate
-		currentVolume = self._volume
+		textLen = 0
+		# Whether textParts contains anything other than whitespace.
+		hasText = False
+		# (character offset, index) pairs for index commands within the pending segment.
+		indexes = []
+		currentLengthScale = self._rateToLengthScale(self._rate)
+		currentVolumeFloat = self._volumeToFloat(self._volume)
+		# The latest segment of text, as (text, indexes, length scale, volume).
+		# It is queued once the next one is known, so that the last segment can be marked final.
+		heldSegment = None
+
+		def queueSegment(segment, final: bool):
+			text, segmentIndexes, lengthScale, volume = segment
+			queueSpeak(
+				text,
+				indexes=segmentIndexes,
+				final=final,
+				speaker_id=speakerId,
+				length_scale=lengthScale,
+				volume=volume,
+			)
+
+		def flush():
+			nonlocal textLen, hasText, heldSegment
+			if hasText:
+				if heldSegment:
+					queueSegment(heldSegment, final=False)
+				heldSegment = ("".join(textParts), list(indexes), currentLengthScale, currentVolumeFloat)
+			elif heldSegment:
+				# Indexes following the held text are reached when it finishes.
+				heldText, heldIndexes, _lengthScale, _volume = heldSegment
+				heldIndexes.extend((len(heldText), index) for _offset, index in indexes)
+			else:
+				for _offset, index in indexes:
+					queueIndex(index)
+			textParts.clear()
+			indexes.clear()
+			textLen = 0
+			hasText = False
 
 		for item in speechSequence:
 			if isinstance(item, str):
 				textParts.append(item)
-
-			elif isinstance(item, IndexCommand):
-				if textParts:
-					text = "".join(textParts)
-					if text.strip():
-						self._bgThread.queueSpeak(
-							text,
-							speaker_id=int(self._variant) if self._variant.isdigit() else 0,
-							length_scale=self._rateToLengthScale(currentRate),
-							volume=self._volumeToFloat(currentVolume),
-						)
-					textParts.clear()
-				self._bgThread.queueIndex(item.index)
-
-			elif isinstance(item, RateCommand):
+				textLen += len(item)
+				if not hasText and item and not item.isspace():
+					hasText = True
+
+			elif isinstance(item, _IndexCommand):
+				indexes.append((textLen, item.index))
+				if textLen >= _MIN_SEGMENT_CHARS:
+					flush()
+
+			elif isinstance(item, _RateCommand):
+				if textParts or indexes:
+					flush()
 				if item.isDefault:
 					currentRate = self._rate
 				else:
 					currentRate = max(0, min(100, item.newValue))
+				currentLengthScale = self._rateToLengthScale(currentRate)
 
-			elif isinstance(item, VolumeCommand):
+			elif isinstance(item, _VolumeCommand):
+				if textParts or indexes:
+					flush()
 				if item.isDefault:
 					currentVolume = self._volume
 				else:
 					currentVolume = max(0, min(100, item.newValue))
+				currentVolumeFloat = self._volumeToFloat(currentVolume)
 
-			elif isinstance(item, BreakCommand):
+			elif isinstance(item, _BreakCommand):
 				# Add silence marker
 				textParts.append(" ")
+				textLen += 1
 
 			elif isinstance(item, CharacterModeCommand):
 				# Character mode - spell out letters
@@ -305,15 +596,10 @@ def speak(self, speechSequence: list):
 				# Language change - Piper handles this per-voice
 				pass
 
-		if textParts:
-			text = "".join(textParts)
-			if text.strip():
-				self._bgThread.queueSpeak(
-					text,
-					speaker_id=int(self._variant) if self._variant.isdigit() else 0,
-					length_scale=self._rateToLengthScale(currentRate),
-					volume=self._volumeToFloat(currentVolume),
-				)
+		if textParts or indexes:
+			flush()
+		if heldSegment:
+			queueSegment(heldSegment, final=True)
 
 	def cancel(self):
 		if self._bgThread:
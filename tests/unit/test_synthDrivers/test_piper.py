@@ -0,0 +1,649 @@
+# A part of NonVisual Desktop Access (NVDA)
+# This file is covered by the GNU General Public License.
+# See the file COPYING for more details.
+# Copyright (C) 2025 NV Access Limited.
+
+"""Unit tests for the Piper synth driver and its submodule."""
+
+import json
+import os
+from pathlib import Path
+import shutil
+import sys
+import tempfile
+import threading
+from types import SimpleNamespace
+from typing import Optional
+import unittest
+from unittest import mock
+
+import nvwave
+
+from speech.commands import IndexCommand, RateCommand, VolumeCommand
+from synthDrivers import _piper
+from synthDrivers.piper import SynthDriver, _MIN_SEGMENT_CHARS, _VOICE_INDEX_FILENAME
+
+
+class FakePiperSynthDriver:
+	_currentVoice = object()
+	_speakerId = 0
+	_rate = 50
+	_volume = 100
+	_rateToLengthScale = SynthDriver._rateToLengthScale
+	_volumeToFloat = SynthDriver._volumeToFloat
+
+	def __init__(self):
+		self._bgThread = mock.Mock(spec=_piper.BgThread)
+
+
+_DEFAULT_LENGTH_SCALE = SynthDriver._rateToLengthScale(FakePiperSynthDriver, FakePiperSynthDriver._rate)
+
+
+def _speakCall(
+	text: str,
+	indexes: list,
+	final: bool = False,
+	lengthScale: float = _DEFAULT_LENGTH_SCALE,
+	volume: float = 1.0,
+):
+	return mock.call.queueSpeak(
+		text,
+		indexes=indexes,
+		final=final,
+		speaker_id=0,
+		length_scale=lengthScale,
+		volume=volume,
+	)
+
+
+class FakeLoadSettingsSynthDriver:
+	_setLoadSetting = SynthDriver._setLoadSetting
+	_warmUpCurrentVoice = SynthDriver._warmUpCurrentVoice
+
+	def __init__(self, newVoice):
+		self._useGpu = False
+		self._currentVoiceId = "test"
+		self._currentVoice = object()
+		self._loadedVoices = {"test": self._currentVoice}
+		self._loadVoice = mock.Mock(return_value=newVoice)
+		self._bgThread = mock.Mock(spec=_piper.BgThread)
+
+
+class FakeVariantsSynthDriver:
+	_getAvailableVariants = SynthDriver._getAvailableVariants
+	_addVoiceInfos = SynthDriver._addVoiceInfos
+
+	def __init__(self):
+		self._voiceData = {
+			"multi": {"name": "multi", "language": "en", "speaker_id_map": {"bob": 1, "alice": 0}},
+			"single": {"name": "single", "language": "fa", "num_speakers": 1},
+		}
+		self._currentVoiceId = "multi"
+		self._availableVariantsVoiceId = None
+
+
+class TestEstimateChunkEnds(unittest.TestCase):
+	def test_sentences(self):
+		self.assertEqual([13, 25], _piper._estimateChunkEnds("Hello there. How are you?"))
+
+	def test_repeatedPunctuation(self):
+		self.assertEqual([8], _piper._estimateChunkEnds("Wait... what"))
+
+	def test_noSentenceEnd(self):
+		self.assertEqual([], _piper._estimateChunkEnds("No sentence end"))
+
+	def test_punctuationWithinWord(self):
+		"""A full stop not followed by whitespace, such as in a number, does not end a sentence."""
+		self.assertEqual([], _piper._estimateChunkEnds("Version 1.5 is out"))
+
+
+class TestSpeak(unittest.TestCase):
+	"""Tests how SynthDriver.speak batches a speech sequence into segments."""
+
+	def _speak(self, speechSequence: list) -> list:
+		driver = FakePiperSynthDriver()
+		SynthDriver.speak(driver, speechSequence)
+		return [c for c in driver._bgThread.mock_calls if c != mock.call.startBatch()]
+
+	def test_shortTextCoalesced(self):
+		"""Short text between index commands is synthesized as one segment."""
+		self.assertEqual(
+			[_speakCall("Hello world. ", [(6, 1), (13, 2)], final=True)],
+			self._speak(["Hello ", IndexCommand(1), "world. ", IndexCommand(2)]),
+		)
+
+	def test_flushedAtMinSegmentChars(self):
+		"""An index command ends the segment once it reaches _MIN_SEGMENT_CHARS."""
+		longText = "a" * _MIN_SEGMENT_CHARS
+		self.assertEqual(
+			[
+				_speakCall(longText, [(_MIN_SEGMENT_CHARS, 1)]),
+				_speakCall("b", [(1, 2)], final=True),
+			],
+			self._speak([longText, IndexCommand(1), "b", IndexCommand(2)]),
+		)
+
+	def test_flushedOnRateCommand(self):
+		self.assertEqual(
+			[_speakCall("Hello ", [(6, 1)]), _speakCall("world", [], final=True)],
+			self._speak(["Hello ", IndexCommand(1), RateCommand(), "world"]),
+		)
+
+	def test_flushedOnVolumeCommand(self):
+		self.assertEqual(
+			[_speakCall("Hello ", []), _speakCall("world", [(5, 1)], final=True)],
+			self._speak(["Hello ", VolumeCommand(), "world", IndexCommand(1)]),
+		)
+
+	def test_indexOnlyFlush(self):
+		"""Segments without speakable text only report their indexes."""
+		self.assertEqual(
+			[mock.call.queueIndex(1), mock.call.queueIndex(2), _speakCall("Hi", [], final=True)],
+			self._speak(["  ", IndexCommand(1), IndexCommand(2), RateCommand(), "Hi"]),
+		)
+
+	def test_trailingIndexesJoinLastSegment(self):
+		"""Indexes after the last text are reported when it finishes, so it remains the final segment."""
+		longText = "a" * _MIN_SEGMENT_CHARS
+		self.assertEqual(
+			[_speakCall(longText, [(_MIN_SEGMENT_CHARS, 1), (_MIN_SEGMENT_CHARS, 2)], final=True)],
+			self._speak([longText, IndexCommand(1), " ", IndexCommand(2)]),
+		)
+
+	def test_indexesOnly(self):
+		self.assertEqual(
+			[mock.call.queueIndex(1)],
+			self._speak([IndexCommand(1)]),
+		)
+
+
+class TestAvailableVoicesAndVariants(unittest.TestCase):
+	"""Tests caching of the voices and variants offered by the driver."""
+
+	def test_voiceInfoReused(self):
+		driver = FakeVariantsSynthDriver()
+		driver._addVoiceInfos()
+		voices = SynthDriver._getAvailableVoices(driver)
+		self.assertEqual(["multi", "single"], list(voices))
+		self.assertIs(voices["multi"], SynthDriver._getAvailableVoices(driver)["multi"])
+
+	def test_variantsCachedPerVoice(self):
+		driver = FakeVariantsSynthDriver()
+		variants = SynthDriver._get_availableVariants(driver)
+		self.assertEqual(["0", "1"], list(variants))
+		self.assertIs(variants, SynthDriver._get_availableVariants(driver))
+		driver._currentVoiceId = "single"
+		self.assertEqual(["0"], list(SynthDriver._get_availableVariants(driver)))
+
+	def test_variantsRebuiltAfterScan(self):
+		"""Clearing the cached voice id, as a voice scan does, rebuilds the variants."""
+		driver = FakeVariantsSynthDriver()
+		SynthDriver._get_availableVariants(driver)
+		driver._voiceData["multi"]["speaker_id_map"] = {"carol": 0}
+		driver._availableVariantsVoiceId = None
+		self.assertEqual(["0"], list(SynthDriver._get_availableVariants(driver)))
+
+
+class TestLoadSettings(unittest.TestCase):
+	"""Tests reloading the current voice when a setting affecting how voices are loaded changes."""
+
+	def test_reloaded(self):
+		newVoice = object()
+		driver = FakeLoadSettingsSynthDriver(newVoice)
+		SynthDriver._set_useGpu(driver, True)
+		self.assertTrue(driver._useGpu)
+		self.assertIs(newVoice, driver._currentVoice)
+		driver._bgThread.queueWarmup.assert_called_once_with(newVoice)
+
+	def test_revertedWhenReloadFails(self):
+		"""If the voice cannot be loaded with the new setting, the previous voice keeps speaking."""
+		driver = FakeLoadSettingsSynthDriver(None)
+		oldVoice = driver._currentVoice
+		SynthDriver._set_useGpu(driver, True)
+		self.assertFalse(driver._useGpu)
+		self.assertIs(oldVoice, driver._currentVoice)
+		self.assertEqual({"test": oldVoice}, driver._loadedVoices)
+
+	def test_unchanged(self):
+		driver = FakeLoadSettingsSynthDriver(object())
+		SynthDriver._set_useGpu(driver, False)
+		driver._loadVoice.assert_not_called()
+
+
+class TestBgThreadSpeak(unittest.TestCase):
+	"""Tests when BgThread hands indexes to the player thread relative to the audio."""
+
+	def setUp(self):
+		chunk = SimpleNamespace(
+			sample_channels=1,
+			sample_rate=22050,
+			sample_width=2,
+			audio_int16_bytes=b"\0\0",
+		)
+		self._voice = mock.Mock()
+		self._voice.synthesize.side_effect = lambda text, config, cancelled_callback: iter([chunk, chunk])
+		self._thread = _piper.BgThread(SimpleNamespace(_currentVoice=self._voice))
+		self._thread._playThread = mock.Mock(spec=_piper.PlayerThread)
+		self._thread._playThread.put.return_value = True
+		#: Stands in for piper.config.SynthesisConfig.
+		self._configClass = mock.Mock(side_effect=lambda **kwargs: SimpleNamespace(**kwargs))
+		patchers = (
+			mock.patch.object(_piper, "PIPER_AVAILABLE", True),
+			mock.patch.object(_piper, "_getSynthesisConfig", return_value=self._configClass),
+		)
+		for patcher in patchers:
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def _playedItems(self) -> list:
+		return [c.args[0] for c in self._thread._playThread.put.call_args_list]
+
+	def test_indexesFollowChunks(self):
+		self._thread._speak(
+			{
+				"text": "Hello there. How are you?",
+				"indexes": [(0, 1), (13, 2), (25, 3)],
+				"final": True,
+				"generation": 0,
+			},
+		)
+		key = (1, 22050, 16)
+		self.assertEqual(
+			[
+				# The index at offset 0 is reported before the first chunk plays.
+				(_piper._PLAY_INDEXES, [1]),
+				(_piper._PLAY_AUDIO, (key, b"\0\0", [2])),
+				(_piper._PLAY_AUDIO, (key, b"\0\0", [3])),
+				(_piper._PLAY_DONE, []),
+			],
+			self._playedItems(),
+		)
+
+	def test_indexesBeyondEstimatedChunksReportedAtEnd(self):
+		self._thread._speak(
+			{"text": "No sentence end", "indexes": [(15, 1)], "final": True, "generation": 0},
+		)
+		key = (1, 22050, 16)
+		self.assertEqual(
+			[
+				(_piper._PLAY_AUDIO, (key, b"\0\0", [])),
+				(_piper._PLAY_AUDIO, (key, b"\0\0", [])),
+				(_piper._PLAY_DONE, [1]),
+			],
+			self._playedItems(),
+		)
+
+	def test_nonFinalSegment(self):
+		"""Segments before the last of a speech sequence neither drain playback nor report being done."""
+		self._thread._speak(
+			{"text": "No sentence end", "indexes": [(15, 1)], "final": False, "generation": 0},
+		)
+		key = (1, 22050, 16)
+		self.assertEqual(
+			[
+				(_piper._PLAY_AUDIO, (key, b"\0\0", [])),
+				(_piper._PLAY_AUDIO, (key, b"\0\0", [])),
+				(_piper._PLAY_INDEXES, [1]),
+			],
+			self._playedItems(),
+		)
+
+	def test_synthesisConfigReused(self):
+		"""A SynthesisConfig is only created when the synthesis parameters change."""
+		for lengthScale in (1.0, 1.0, 1.5):
+			self._thread._speak(
+				{
+					"text": "Hello",
+					"indexes": [],
+					"generation": 0,
+					"speaker_id": 0,
+					"length_scale": lengthScale,
+				},
+			)
+		self.assertEqual(
+			[1.0, 1.5],
+			[c.kwargs["length_scale"] for c in self._configClass.call_args_list],
+		)
+		configs = [c.args[1] for c in self._voice.synthesize.call_args_list]
+		self.assertIs(configs[0], configs[1])
+		self.assertEqual(1.5, configs[2].length_scale)
+
+
+class TestBgThreadBacklog(unittest.TestCase):
+	"""Tests skipping of queued speech once synthesis falls too far behind."""
+
+	def setUp(self):
+		self._thread = _piper.BgThread(SimpleNamespace(_currentVoice=None))
+		#: Segments synthesized and items handed to the player, in order.
+		self._events = []
+		self._thread._playThread = mock.Mock(spec=_piper.PlayerThread)
+		self._thread._playThread.generation = 0
+		self._thread._playThread.put.side_effect = lambda item, generation: self._events.append(item) or True
+		patcher = mock.patch.dict(
+			_piper._SYNTH_HANDLERS,
+			{_piper._MSG_SPEAK: lambda thread, data: self._events.append(data["text"])},
+		)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def _queueSegments(self, start: int, count: int):
+		for index in range(start, start + count):
+			self._thread.queueSpeak(str(index), indexes=[(1, index)])
+
+	def test_singleSpeakCallNotSkipped(self):
+		"""Segments of the latest speak call are synthesized however many there are."""
+		segmentCount = _piper._MAX_QUEUED_ITEMS + 36
+		self._thread.startBatch()
+		self._queueSegments(0, segmentCount)
+		self.assertTrue(self._thread._processPending())
+		self.assertEqual([str(index) for index in range(segmentCount)], self._events)
+
+	def test_earlierSpeakCallsSkipped(self):
+		"""Only the latest _MAX_QUEUED_ITEMS segments of earlier speak calls are synthesized."""
+		self._thread.startBatch()
+		self._queueSegments(0, _piper._MAX_QUEUED_ITEMS + 6)
+		self._thread.startBatch()
+		self._queueSegments(1000, 1)
+		self.assertTrue(self._thread._processPending())
+		self.assertEqual(
+			[
+				(_piper._PLAY_INDEXES, [0, 1, 2, 3, 4, 5]),
+				*(str(index) for index in range(6, _piper._MAX_QUEUED_ITEMS + 6)),
+				"1000",
+			],
+			self._events,
+		)
+
+	def test_skippedIndexesMerged(self):
+		"""Indexes of skipped speech are merged with adjacent index messages, keeping their order."""
+		self._thread.startBatch()
+		self._thread.queueIndex(100)
+		self._queueSegments(0, 1)
+		self._thread.queueIndex(101)
+		self._queueSegments(1, _piper._MAX_QUEUED_ITEMS + 1)
+		self._thread.startBatch()
+		self.assertTrue(self._thread._processPending())
+		self.assertEqual(
+			[
+				(_piper._PLAY_INDEXES, [100, 0, 101, 1]),
+				*(str(index) for index in range(2, _piper._MAX_QUEUED_ITEMS + 2)),
+			],
+			self._events,
+		)
+
+	def test_shutdown(self):
+		self._thread.startBatch()
+		self._thread.queueIndex(1)
+		self._thread.stop()
+		self.assertFalse(self._thread._processPending())
+		self.assertEqual([(_piper._PLAY_INDEXES, [1])], self._events)
+
+
+class TestPlayerThread(unittest.TestCase):
+	"""Tests playback of synthesized audio, without starting the player thread."""
+
+	def setUp(self):
+		self._playerSpec = nvwave.WavePlayer
+		#: Players created, keyed by (channels, samples per second, bits per sample).
+		self._players = {}
+		patcher = mock.patch("nvwave.WavePlayer", side_effect=self._createPlayer)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		self._thread = _piper.PlayerThread(synth=None)
+
+	def _createPlayer(self, channels: int, samplesPerSec: int, bitsPerSample: int):
+		player = mock.create_autospec(self._playerSpec, instance=True)
+		self._players[(channels, samplesPerSec, bitsPerSample)] = player
+		return player
+
+	def _play(self, key, indexes=(), generation: int = 0):
+		self._thread._playAudio((key, b"\0\0", list(indexes)), generation)
+
+	def test_playerReusedForFormat(self):
+		self._play((1, 22050, 16))
+		self._play((1, 22050, 16))
+		self.assertEqual([(1, 22050, 16)], list(self._players))
+		self.assertEqual(2, self._players[(1, 22050, 16)].feed.call_count)
+
+	def test_previousPlayerIdledWithoutLock(self):
+		"""Switching format waits for the previous player without blocking cancel."""
+		self._play((1, 22050, 16))
+		previous = self._players[(1, 22050, 16)]
+		previous.idle.side_effect = lambda: self.assertFalse(self._thread._playerLock.locked())
+		self._play((1, 16000, 16))
+		previous.idle.assert_called_once()
+		self._players[(1, 16000, 16)].feed.assert_called_once()
+
+	def test_leastRecentlyUsedPlayerClosed(self):
+		keys = [(1, rate, 16) for rate in (16000, 22050, 24000)]
+		for key in keys:
+			self._play(key)
+		# Use the oldest player again, so that the second becomes least recently used.
+		self._play(keys[0])
+		self._play((1, 44100, 16))
+		self._players[keys[1]].close.assert_called_once()
+		self._players[keys[0]].close.assert_not_called()
+		self._players[keys[2]].close.assert_not_called()
+		self.assertEqual(_piper._MAX_POOLED_PLAYERS, len(self._thread._playerPool))
+
+	def test_indexesReportedWhenAudioPlayed(self):
+		with mock.patch.object(_piper, "synthIndexReached") as synthIndexReached:
+			self._play((1, 22050, 16), indexes=[1, 2])
+			synthIndexReached.notify.assert_not_called()
+			onDone = self._players[(1, 22050, 16)].feed.call_args.kwargs["onDone"]
+			onDone()
+		self.assertEqual(
+			[mock.call(synth=None, index=1), mock.call(synth=None, index=2)],
+			synthIndexReached.notify.call_args_list,
+		)
+
+	def test_cancel(self):
+		"""Cancelling stops the active player and discards audio queued before the cancel."""
+		self._play((1, 22050, 16))
+		self.assertTrue(self._thread.put((_piper._PLAY_AUDIO, None), generation=0))
+		self._thread.cancel()
+		self._players[(1, 22050, 16)].stop.assert_called_once()
+		self.assertEqual(1, self._thread.generation)
+		self.assertEqual(0, len(self._thread._items))
+		self.assertFalse(self._thread.put((_piper._PLAY_AUDIO, None), generation=0))
+		self._play((1, 16000, 16), generation=0)
+		self.assertNotIn((1, 16000, 16), self._players)
+
+	def test_cancelUnblocksPut(self):
+		"""Synthesis waiting for buffer space is released when speech is cancelled."""
+		for _i in range(_piper._MAX_PLAYBACK_ITEMS):
+			self._thread.put((_piper._PLAY_INDEXES, []), generation=0)
+		results = []
+		putThread = threading.Thread(
+			target=lambda: results.append(self._thread.put((_piper._PLAY_INDEXES, []), generation=0)),
+		)
+		putThread.start()
+		self._thread.cancel()
+		putThread.join(timeout=5)
+		self.assertEqual([False], results)
+
+	def test_playDone(self):
+		self._play((1, 22050, 16))
+		with (
+			mock.patch.object(_piper, "synthIndexReached") as synthIndexReached,
+			mock.patch.object(_piper, "synthDoneSpeaking") as synthDoneSpeaking,
+		):
+			self._thread._playDone([1], generation=0)
+		self._players[(1, 22050, 16)].idle.assert_called_once()
+		synthIndexReached.notify.assert_called_once_with(synth=None, index=1)
+		synthDoneSpeaking.notify.assert_called_once_with(synth=None)
+
+	def test_playDoneAfterCancel(self):
+		self._play((1, 22050, 16))
+		self._thread.cancel()
+		with (
+			mock.patch.object(_piper, "synthIndexReached") as synthIndexReached,
+			mock.patch.object(_piper, "synthDoneSpeaking") as synthDoneSpeaking,
+		):
+			self._thread._playDone([1], generation=0)
+		synthIndexReached.notify.assert_not_called()
+		synthDoneSpeaking.notify.assert_not_called()
+
+	def test_closePlayer(self):
+		self._play((1, 22050, 16))
+		self._thread._closePlayer()
+		self._players[(1, 22050, 16)].close.assert_called_once()
+		self.assertEqual(0, len(self._thread._playerPool))
+
+
+class TestQuantizedModelCache(unittest.TestCase):
+	"""Tests tracking of quantized copies of voice models next to the originals."""
+
+	def setUp(self):
+		tempDir = tempfile.TemporaryDirectory()
+		self.addCleanup(tempDir.cleanup)
+		self._modelPath = os.path.join(tempDir.name, "test.onnx")
+		self._quantizedPath = os.path.join(tempDir.name, "test.q8.onnx")
+		with open(self._modelPath, "wb") as f:
+			f.write(b"model")
+
+	def _writeQuantizedModel(self):
+		with open(self._quantizedPath, "wb") as f:
+			f.write(b"quantized")
+
+	def _touchModel(self):
+		mtime = os.stat(self._modelPath).st_mtime_ns + 1_000_000_000
+		os.utime(self._modelPath, ns=(mtime, mtime))
+
+	def test_missing(self):
+		self.assertIsNone(_piper.getQuantizedModelPath(self._modelPath))
+		self.assertFalse(_piper.hasQuantizationFailed(self._modelPath))
+
+	def test_notUsedUntilMarkedValid(self):
+		self._writeQuantizedModel()
+		self.assertIsNone(_piper.getQuantizedModelPath(self._modelPath))
+		_piper.markQuantizedModelValid(self._modelPath)
+		self.assertEqual(self._quantizedPath, _piper.getQuantizedModelPath(self._modelPath))
+
+	def test_modelChanged(self):
+		"""A quantized copy of an earlier version of the model is not used."""
+		self._writeQuantizedModel()
+		_piper.markQuantizedModelValid(self._modelPath)
+		self._touchModel()
+		self.assertIsNone(_piper.getQuantizedModelPath(self._modelPath))
+
+	def test_quantizedModelDeleted(self):
+		self._writeQuantizedModel()
+		_piper.markQuantizedModelValid(self._modelPath)
+		os.remove(self._quantizedPath)
+		self.assertIsNone(_piper.getQuantizedModelPath(self._modelPath))
+
+	def test_discard(self):
+		"""A discarded model is deleted and not quantized again until the model changes."""
+		self._writeQuantizedModel()
+		_piper.markQuantizedModelValid(self._modelPath)
+		_piper.discardQuantizedModel(self._modelPath)
+		self.assertFalse(os.path.exists(self._quantizedPath))
+		self.assertIsNone(_piper.getQuantizedModelPath(self._modelPath))
+		self.assertTrue(_piper.hasQuantizationFailed(self._modelPath))
+		self._touchModel()
+		self.assertFalse(_piper.hasQuantizationFailed(self._modelPath))
+
+	def test_quantizeFailure(self):
+		"""A failed quantization removes partial output and is recorded."""
+
+		def quantize_dynamic(modelInput, modelOutput, **kwargs):
+			with open(modelOutput, "wb") as f:
+				f.write(b"partial")
+			raise RuntimeError("quantization failed")
+
+		quantization = SimpleNamespace(quantize_dynamic=quantize_dynamic, QuantType=mock.Mock())
+		with mock.patch.dict(
+			sys.modules,
+			{"onnxruntime": mock.Mock(quantization=quantization), "onnxruntime.quantization": quantization},
+		):
+			self.assertIsNone(_piper.quantizeModel(self._modelPath))
+		self.assertFalse(os.path.exists(self._quantizedPath))
+		self.assertTrue(_piper.hasQuantizationFailed(self._modelPath))
+
+
+class FakeVoiceDirSynthDriver:
+	_scanVoices = SynthDriver._scanVoices
+	_readVoiceIndex = SynthDriver._readVoiceIndex
+	_writeVoiceIndex = SynthDriver._writeVoiceIndex
+	_addVoiceInfos = SynthDriver._addVoiceInfos
+
+	def __init__(self, voiceDir: Path):
+		self._voiceDir = voiceDir
+		self._voiceData = {}
+		self._availableVariantsVoiceId = None
+
+
+class TestVoiceIndex(unittest.TestCase):
+	"""Tests caching of parsed voice configs in the voice directory."""
+
+	def setUp(self):
+		tempDir = tempfile.TemporaryDirectory()
+		self.addCleanup(tempDir.cleanup)
+		self._root = Path(tempDir.name)
+		self._voiceDir = self._root / "voices"
+		self._voiceDir.mkdir()
+		(self._voiceDir / "test.onnx").write_bytes(b"")
+		self._configPath = self._voiceDir / "test.onnx.json"
+		self._writeConfig("en-us")
+
+	def _writeConfig(self, espeakVoice: str, mtimeNs: Optional[int] = None):
+		self._configPath.write_text(json.dumps({"espeak": {"voice": espeakVoice}}), encoding="utf-8")
+		if mtimeNs is not None:
+			os.utime(self._configPath, ns=(mtimeNs, mtimeNs))
+
+	def _scan(self, voiceDir: Optional[Path] = None) -> dict:
+		driver = FakeVoiceDirSynthDriver(voiceDir or self._voiceDir)
+		driver._scanVoices()
+		return driver._voiceData
+
+	def test_miss(self):
+		"""Without an index, voice configs are parsed and the index is written."""
+		voices = self._scan()
+		self.assertEqual("en", voices["test"]["language"])
+		self.assertEqual(str(self._voiceDir / "test.onnx"), voices["test"]["path"])
+		self.assertTrue((self._voiceDir / _VOICE_INDEX_FILENAME).is_file())
+
+	def test_hit(self):
+		"""While no voice file changes, voices are read from the index without parsing configs."""
+		self._scan()
+		mtime = self._configPath.stat().st_mtime_ns
+		self._writeConfig("de", mtimeNs=mtime)
+		self.assertEqual("en", self._scan()["test"]["language"])
+
+	def test_missWhenConfigModified(self):
+		self._scan()
+		mtime = self._configPath.stat().st_mtime_ns
+		self._writeConfig("de", mtimeNs=mtime + 1_000_000_000)
+		self.assertEqual("de", self._scan()["test"]["language"])
+
+	def test_missWhenVoiceRemoved(self):
+		self._scan()
+		(self._voiceDir / "test.onnx").unlink()
+		self.assertEqual({}, self._scan())
+
+	def test_copiedDirectory(self):
+		"""An index copied along with its voices refers to the voices in the new directory."""
+		self._scan()
+		copiedDir = self._root / "copied"
+		shutil.copytree(self._voiceDir, copiedDir)
+		voices = self._scan(copiedDir)
+		self.assertEqual(str(copiedDir / "test.onnx"), voices["test"]["path"])
+		self.assertEqual(str(copiedDir / "test.onnx.json"), voices["test"]["config_path"])
+
+	def test_malformedIndex(self):
+		"""A malformed index is ignored and rebuilt."""
+		self._scan()
+		indexPath = self._voiceDir / _VOICE_INDEX_FILENAME
+		files = json.loads(indexPath.read_text(encoding="utf-8"))["files"]
+		for voices in (
+			None,
+			{"test": "not a voice"},
+			{"test": {"name": "test", "language": "xx"}},
+			{"test": {"name": "test", "language": "xx", "fileName": "../elsewhere/test.onnx"}},
+		):
+			with self.subTest(voices=voices):
+				indexPath.write_text(json.dumps({"files": files, "voices": voices}), encoding="utf-8")
+				self.assertEqual("en", self._scan()["test"]["language"])
+		indexPath.write_text("not json", encoding="utf-8")
+		self.assertEqual("en", self._scan()["test"]["language"])